@@ -0,0 +1,27 @@
+import argparse
+
+from dao import DAO
+
+
+def main() -> None:
+    """Compresses a database into block compressed storage"""
+    parser = argparse.ArgumentParser(
+        description="Compress a contact database into a new database file"
+    )
+    parser.add_argument(
+        "source", help="vCard file, compressed file or sharded directory"
+    )
+    parser.add_argument("target", help="the new compressed database file")
+    parser.add_argument(
+        "--codec",
+        choices=["zlib", "lzma"],
+        default="zlib",
+        help="compression of the blocks (default: zlib)",
+    )
+    args = parser.parse_args()
+
+    DAO(args.source).compress(args.target, args.codec)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+from contextlib import contextmanager
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+import json
+import lzma
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+
+# Leading (and trailing) bytes identifying a compressed database file
+MAGIC: bytes = b"VCFZ\x00\x01\r\n"
+
+# The trailer is the offset of the block index followed by the magic
+TRAILER: struct.Struct = struct.Struct(">Q")
+
+CODECS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": lambda data: zlib.compress(data, 6),
+    "lzma": lzma.compress,
+}
+DECODERS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": zlib.decompress,
+    "lzma": lzma.decompress,
+}
+
+
+def is_compressed(path: str) -> bool:
+    """Returns whether the file is a compressed database"""
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+class CompressedStorage:
+    """Database file made of independently compressed blocks of vCards
+
+    Layout: MAGIC, compressed blocks, JSON block index, index offset, MAGIC.
+    The index records the offset, length and the (escaped) names of
+    the contacts of every block, so a lookup only inflates its block.
+    """
+
+    def __init__(self, path: str, encoding: str = "UTF-8"):
+        self.path: str = path
+        self.ENCODING: str = encoding
+
+        # Default number of vCards per block
+        self.BLOCK_SIZE: int = 1000
+
+    def read_index(self) -> Dict:
+        """Returns the block index of the file"""
+        with open(self.path, "rb") as file:
+            return self._read_index(file)[0]
+
+    def _read_index(self, file) -> Tuple[Dict, int]:
+        """Returns the block index and its offset in the opened file"""
+        file.seek(-(TRAILER.size + len(MAGIC)), os.SEEK_END)
+        (index_offset,) = TRAILER.unpack(file.read(TRAILER.size))
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a valid database".format(self.path))
+        index_length = file.seek(0, os.SEEK_END) - index_offset
+        file.seek(index_offset)
+        index = json.loads(
+            file.read(index_length - TRAILER.size - len(MAGIC))
+        )
+        return index, index_offset
+
+    def _write_index(self, file, index: Dict) -> None:
+        """Writes the index and the trailer at the current position"""
+        index_offset = file.tell()
+        file.write(json.dumps(index).encode(self.ENCODING))
+        file.write(TRAILER.pack(index_offset))
+        file.write(MAGIC)
+        file.truncate()
+
+    def _names_of(self, text: str) -> List[str]:
+        """Returns the escaped names (FN) of the vCards in the text"""
+        return [
+            line[3:]
+            for line in text.replace("\r\n ", "").split("\r\n")
+            if line.startswith("FN:")
+        ]
+
+    def _write_block(self, file, text: str, codec: str) -> Dict:
+        """Compresses and writes a block, returns its index entry"""
+        data = CODECS[codec](text.encode(self.ENCODING))
+        entry = {
+            "offset": file.tell(),
+            "length": len(data),
+            "names": self._names_of(text),
+        }
+        file.write(data)
+        return entry
+
+    def _read_block(self, file, entry: Dict, codec: str) -> str:
+        file.seek(entry["offset"])
+        data = file.read(entry["length"])
+        return DECODERS[codec](data).decode(self.ENCODING)
+
+    def _copy_block(self, source, target, entry: Dict) -> Dict:
+        """Copies a block without recompressing it, returns its new entry"""
+        source.seek(entry["offset"])
+        new_entry = dict(entry, offset=target.tell())
+        target.write(source.read(entry["length"]))
+        return new_entry
+
+    @contextmanager
+    def _replacement(self) -> Iterator[BinaryIO]:
+        """Yields a temporary file which then atomically replaces the file,
+        the file is left untouched if anything fails on the way
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        target = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        try:
+            with target:
+                target.write(MAGIC)
+                yield target
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, target.name)
+            os.replace(target.name, self.path)
+        except BaseException:
+            if os.path.exists(target.name):
+                os.remove(target.name)
+            raise
+
+    def write(
+        self,
+        vcard_strs: Iterable[str],
+        codec: str = "zlib",
+        block_size: Optional[int] = None,
+    ) -> None:
+        """Writes a new compressed database out of the vCard strings
+
+        vcard_strs (Iterable[str]): serialized contacts, consumed lazily
+        codec (str): "zlib" or "lzma"
+        block_size (int, optional): number of vCards per block
+        """
+        block_size = block_size or self.BLOCK_SIZE
+        index: Dict = {"codec": codec, "blocks": []}
+        with self._replacement() as file:
+            block: List[str] = []
+            for vcard_str in vcard_strs:
+                block.append(vcard_str)
+                if len(block) >= block_size:
+                    index["blocks"].append(
+                        self._write_block(file, "".join(block), codec)
+                    )
+                    block = []
+            if block != []:
+                index["blocks"].append(
+                    self._write_block(file, "".join(block), codec)
+                )
+            self._write_index(file, index)
+
+    def iter_blocks(self) -> Iterator[str]:
+        """Yields the decompressed text of the blocks one by one"""
+        with open(self.path, "rb") as file:
+            index, _ = self._read_index(file)
+            for entry in index["blocks"]:
+                yield self._read_block(file, entry, index["codec"])
+
+    def find_blocks(self, name: str) -> Iterator[str]:
+        """Yields the decompressed text of the blocks holding the name
+
+        name (str): the escaped name, as written in the vCard
+        """
+        with open(self.path, "rb") as file:
+            index, _ = self._read_index(file)
+            for entry in index["blocks"]:
+                if name in entry["names"]:
+                    yield self._read_block(file, entry, index["codec"])
+
+    def append(self, vcard_strs: List[str]) -> None:
+        """Appends the vCard strings, the last block is filled up to
+        BLOCK_SIZE vCards before a new block is started
+
+        The file is replaced as a whole, so a crash can't corrupt it, but
+        only the last block is recompressed, the others are just copied
+        """
+        with open(self.path, "rb") as source, self._replacement() as target:
+            index, _ = self._read_index(source)
+            codec = index["codec"]
+            entries = index["blocks"]
+
+            # A partially filled last block is merged with the new vCards
+            block: List[str] = []
+            if entries != [] and len(entries[-1]["names"]) < self.BLOCK_SIZE:
+                block.append(self._read_block(source, entries[-1], codec))
+                block_length = len(entries[-1]["names"])
+                entries = entries[:-1]
+            else:
+                block_length = 0
+
+            new_index: Dict = {"codec": codec, "blocks": []}
+            for entry in entries:
+                new_index["blocks"].append(
+                    self._copy_block(source, target, entry)
+                )
+            for vcard_str in vcard_strs:
+                block.append(vcard_str)
+                block_length += 1
+                if block_length >= self.BLOCK_SIZE:
+                    new_index["blocks"].append(
+                        self._write_block(target, "".join(block), codec)
+                    )
+                    block = []
+                    block_length = 0
+            if block != []:
+                new_index["blocks"].append(
+                    self._write_block(target, "".join(block), codec)
+                )
+            self._write_index(target, new_index)
+
+    def rewrite(self, substitute: Callable[[str], Optional[str]]) -> None:
+        """Rewrites the blocks into a new file which replaces the old one
+
+        Blocks for which substitute returns None are copied without being
+        recompressed, other blocks are replaced by the returned text
+
+        substitute (Callable[[str], Optional[str]]): block text -> new text
+        """
+        with open(self.path, "rb") as source, self._replacement() as target:
+            index, _ = self._read_index(source)
+            codec = index["codec"]
+            new_index: Dict = {"codec": codec, "blocks": []}
+            for entry in index["blocks"]:
+                text = substitute(self._read_block(source, entry, codec))
+                if text is None:
+                    new_index["blocks"].append(
+                        self._copy_block(source, target, entry)
+                    )
+                elif text != "":
+                    new_index["blocks"].append(
+                        self._write_block(target, text, codec)
+                    )
+            self._write_index(target, new_index)
@@ -0,0 +1,87 @@
+from typing import Any, Dict, Iterable, List, Optional, Union, Tuple
+
+
+class ContactFilter:
+    def __init__(self):
+        # Lowercased searchable text of every row, keyed by the row's key
+        self.haystacks: Dict[str, str] = {}
+
+        # The last answered query and the keys of the rows it matched,
+        # so a query extending it only has to rescan those rows,
+        # None stands for all the rows
+        self.last_query: str = ""
+        self.last_result: Optional[List[str]] = None
+
+        # Bumped by every change of the rows, a result computed while
+        # the rows were changing isn't remembered
+        self.version: int = 0
+
+    def _haystack(self, row: Union[List[Any], Tuple[Any]]) -> str:
+        # The separator can't be typed in, so a match can't span two columns
+        return "\0".join(str(value) for value in row).lower()
+
+    def set_data(
+        self,
+        keys: Iterable[str],
+        data: Iterable[Union[List[Any], Tuple[Any]]],
+    ) -> None:
+        """Prepares the rows to filter and forgets the previous result
+
+        keys (Iterable[str]): keys of the rows, e.g. Treeview item ids
+        data (Iterable): rows of the MultiColumnListbox
+        """
+        self.haystacks = {
+            key: self._haystack(row) for key, row in zip(keys, data)
+        }
+        self._invalidate()
+
+    def set_row(self, key: str, row: Union[List[Any], Tuple[Any]]) -> None:
+        """Adds a new row or replaces an existing one"""
+        self.haystacks[key] = self._haystack(row)
+        self._invalidate()
+
+    def remove_row(self, key: str) -> None:
+        """Removes a row"""
+        del self.haystacks[key]
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self.version += 1
+        self.last_query = ""
+        self.last_result = None
+
+    def matches(self, key: str, query: str) -> bool:
+        """Returns whether the row contains the query in any column"""
+        return query.lower() in self.haystacks[key]
+
+    def match(self, query: str) -> List[str]:
+        """Returns keys of the rows containing the query in any column
+
+        Matching is case insensitive. When the query extends the previous
+        one, only the rows matched by the previous query are rescanned.
+        May run off the Tk thread while the rows are being changed.
+
+        query (str): the text typed in by the user
+        """
+        query = query.lower()
+        version = self.version
+        haystacks = self.haystacks
+        last_result = self.last_result
+        if last_result is not None and query.startswith(self.last_query):
+            result = []
+            for key in last_result:
+                haystack = haystacks.get(key)
+                if haystack is not None and query in haystack:
+                    result.append(key)
+        else:
+            # Snapshot of the rows, taken at once under the GIL
+            result = [
+                key
+                for key, haystack in list(haystacks.items())
+                if query in haystack
+            ]
+
+        if version == self.version:
+            self.last_query = query
+            self.last_result = result
+        return result
@@ -0,0 +1,148 @@
+from typing import Dict, Iterable, List, Optional
+import re
+
+from person import Person
+
+
+class ContactIndex:
+    def __init__(self, default_country_prefix: str = "421"):
+        # Country calling code used for numbers written in the national
+        # format (e.g. 0905 123 456), without the leading "+"
+        self.default_country_prefix: str = default_country_prefix
+
+        # Reverse lookup tables: normalized key -> persons owning the key
+        self.phones: Dict[str, List[Person]] = {}
+        self.emails: Dict[str, List[Person]] = {}
+
+        # Precompiled pattern used to strip everything but the digits
+        self._non_digits = re.compile("[^0-9]")
+
+    def normalize_phone(self, phone: Optional[str]) -> str:
+        """Returns the phone number reduced to its digits in the
+        international format (country prefix included), or an empty string
+
+        phone (str): a free-form phone number, e.g. "+421 905 123 456"
+        """
+        if not phone:
+            return ""
+        phone = phone.strip()
+        digits = self._non_digits.sub("", phone)
+        if phone.startswith("+"):
+            return digits
+
+        # International call prefix written out instead of the "+"
+        if digits.startswith("00"):
+            return digits[2:]
+
+        # National format: swap the trunk prefix for the country prefix
+        if digits.startswith("0") and self.default_country_prefix:
+            return self.default_country_prefix + digits[1:]
+        return digits
+
+    def normalize_email(self, email: Optional[str]) -> str:
+        """Returns the lowercased email address without surrounding spaces
+
+        email (str): an email address
+        """
+        if not email:
+            return ""
+        return email.strip().lower()
+
+    def build(self, contacts: Iterable[Person]) -> None:
+        """Rebuilds the whole index from the given contacts
+
+        contacts (Iterable[Person]): all the contacts to index
+        """
+        self.phones = {}
+        self.emails = {}
+        for person in contacts:
+            self.add(person)
+
+    def add(self, person: Person) -> None:
+        """Adds a single person to the index
+
+        person (Person): a Person obj to index
+        """
+        phone = self.normalize_phone(person.phone)
+        if phone != "":
+            self.phones.setdefault(phone, []).append(person)
+        email = self.normalize_email(person.email)
+        if email != "":
+            self.emails.setdefault(email, []).append(person)
+
+    def remove(self, person: Person) -> None:
+        """Removes a single person from the index
+
+        Persons are matched by their data, so a Person obj rebuilt
+        from the listbox removes the originally indexed one
+
+        person (Person): a Person obj to remove
+        """
+        self._remove_from(
+            self.phones, self.normalize_phone(person.phone), person
+        )
+        self._remove_from(
+            self.emails, self.normalize_email(person.email), person
+        )
+
+    def update(self, old_person: Person, new_person: Person) -> None:
+        """Replaces the old version of a person with the new one
+
+        old_person (Person): the person as it was indexed so far
+        new_person (Person): the edited person
+        """
+        self.remove(old_person)
+        self.add(new_person)
+
+    def _remove_from(
+        self, table: Dict[str, List[Person]], key: str, person: Person
+    ) -> None:
+        """Removes the first person with the same data from table[key]"""
+        bucket = table.get(key)
+        if not bucket:
+            return
+        data = person.get_tuple_data()
+        for x, indexed in enumerate(bucket):
+            if indexed is person or indexed.get_tuple_data() == data:
+                del bucket[x]
+                break
+        if bucket == []:
+            del table[key]
+
+    def lookup_phone(self, phone: str) -> List[Person]:
+        """Returns the persons owning the given phone number
+
+        phone (str): a free-form phone number
+        """
+        return list(self.phones.get(self.normalize_phone(phone), []))
+
+    def lookup_email(self, email: str) -> List[Person]:
+        """Returns the persons owning the given email address
+
+        email (str): an email address, case insensitive
+        """
+        return list(self.emails.get(self.normalize_email(email), []))
+
+    def lookup_phones(self, phones: Iterable[str]) -> Dict[str, List[Person]]:
+        """Batch variant of lookup_phone
+
+        phones (Iterable[str]): free-form phone numbers to look up,
+        the returned dict is keyed by the numbers as they were given
+        """
+        table = self.phones
+        normalize = self.normalize_phone
+        return {
+            phone: list(table.get(normalize(phone), [])) for phone in phones
+        }
+
+    def lookup_emails(self, emails: Iterable[str]) -> Dict[str, List[Person]]:
+        """Batch variant of lookup_email
+
+        emails (Iterable[str]): email addresses to look up,
+        the returned dict is keyed by the addresses as they were given
+        """
+        table = self.emails
+        normalize = self.normalize_email
+        return {
+            email: list(table.get(normalize(email), [])) for email in emails
+        }
@@ -1,4 +1,6 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 import datetime
+from itertools import islice
 from tkinter import (
     Button,
     Entry,
@@ -15,12 +17,24 @@ from tkinter import (
     font,
 )
 from tkinter.constants import BOTTOM, TOP
-from typing import Any, List, Dict, Optional, Tuple, Union
+from typing import Any, Iterator, List, Dict, Optional, Tuple, Union
 import vobject
 
+from contactIndex import ContactIndex
+from contactModel import ADDED, REMOVED, UPDATED, ContactEvent, ContactModel
+from contactQuery import (
+    BirthdayOn,
+    EmailIs,
+    Eq,
+    PhoneIs,
+    Query,
+    QueryEngine,
+    month_day,
+)
 from multiColumnListbox import MultiColumnListbox
 from person import Person
 from dao import DAO
+from vcfImporter import DirectoryImporter
 
 
 def _convert_stringval(value) -> Union[int, str, Any]:
@@ -44,6 +58,39 @@ class ContactManager:
         # Instantiation of Database Access Object -> DAO
         self.dao: DAO = DAO(location)
 
+        # The loaded contacts, announcing every change to the subscribers
+        self.model: ContactModel = ContactModel(self.dao)
+
+        # Reverse phone/email lookup index, kept in sync with the model
+        self.index: ContactIndex = ContactIndex()
+
+        # Query engine over the loaded contacts, keeps the index up to date
+        self.query_engine: QueryEngine = QueryEngine(self.index)
+        self.model.subscribe(self._update_query_engine)
+
+        # Names of the contacts having bday today, kept in sync with the model
+        self.have_bday_today: List[str] = []
+        self.model.subscribe(self._update_bday_reminder)
+
+        # Listbox row ids of the contacts, keyed by the identity of Person obj
+        self.listbox_rows: Dict[int, str] = {}
+
+        # Number of contacts displayed at once in the search results
+        self.SEARCH_PAGE_SIZE: int = 10
+
+        # Number of contacts loaded into the listbox at once, the next page
+        # is loaded whenever Tk is idle
+        self.LISTBOX_PAGE_SIZE: int = 500
+
+        # Directory imports run off the Tk thread, which polls their
+        # progress (files done, all files) and result
+        self.IMPORT_POLL_DELAY: int = 100
+        self.import_future: Optional[Future] = None
+        self.import_progress: Tuple[int, int] = (0, 0)
+        self._import_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1
+        )
+
         # Naming convention constants
         self.NAME: str = "Meno"
         self.BDAY: str = "Narodeniny"
@@ -74,30 +121,92 @@ class ContactManager:
         self.listbox_frame.pack(fill="both", side=BOTTOM, expand=True)
         self.menu_frame = Frame()
         self.menu_frame.pack(fill="both", side=TOP)
+        self.filter_frame = Frame()
+        self.filter_frame.pack(fill="x", side=TOP)
 
         # Build main parts of the GUI
         self._build_listbox()
+        self._build_filter_bar()
         self._build_menus()
 
         # Create bday reminder popup alert
         if self.have_bday_today != []:
             message = "Dnes má narodeniny:\n{}".format(
-                self.have_bday_today.pop()
+                ", ".join(self.have_bday_today)
             )
-            for celebrant in self.have_bday_today:
-                message += ", " + celebrant
             messagebox.showwarning("Narodeniny", message)
 
         # Mainloop to make sure it's working as intended
         self.window.mainloop()
 
     def _build_listbox(self) -> None:
-        """Instantiate self.listbox - contacts preloaded, MultiColumnListbox"""
+        """Instantiate self.listbox - contacts loaded page by page"""
         self.listbox: MultiColumnListbox = MultiColumnListbox(
             self.listbox_frame,
             [self.NAME, self.BDAY, self.EMAIL, self.PHONE, self.NOTE],
         )
-        self.listbox.load_data([x.get_tuple_data() for x in self.contacts])
+        self.listbox_rows = {}
+
+        # From now on, only the changed rows are updated
+        self.model.subscribe(self._update_listbox)
+
+        # The query is evaluated lazily, one page at a time
+        self.listbox_pages: Iterator[Person] = iter(self.query_engine.query())
+        self._load_listbox_page()
+
+    def _load_listbox_page(self) -> None:
+        """Loads the next page of the contacts into the listbox and schedules
+        loading of the following one, so the GUI stays responsive
+        """
+        page = list(islice(self.listbox_pages, self.LISTBOX_PAGE_SIZE))
+        for person in page:
+            # Skip the contacts removed or already displayed in the meantime
+            if (
+                self.model.find(person) is person
+                and id(person) not in self.listbox_rows
+            ):
+                self.listbox_rows[id(person)] = self.listbox.insert_row(
+                    person.get_tuple_data()
+                )
+        if len(page) == self.LISTBOX_PAGE_SIZE:
+            self.window.after_idle(self._load_listbox_page)
+
+    def _update_listbox(self, events: List[ContactEvent]) -> None:
+        """Applies a batch of change events of the model to the listbox"""
+        for event in events:
+            if event.kind == ADDED:
+                self.listbox_rows[id(event.person)] = self.listbox.insert_row(
+                    event.person.get_tuple_data()
+                )
+            elif event.kind == UPDATED:
+                # A contact whose page isn't loaded yet is simply inserted
+                row = self.listbox_rows.pop(id(event.old_person), None)
+                if row is None:
+                    row = self.listbox.insert_row(
+                        event.person.get_tuple_data()
+                    )
+                else:
+                    self.listbox.update_row(
+                        row, event.person.get_tuple_data()
+                    )
+                self.listbox_rows[id(event.person)] = row
+            elif id(event.person) in self.listbox_rows:
+                self.listbox.delete_row(
+                    self.listbox_rows.pop(id(event.person))
+                )
+
+    def _build_filter_bar(self) -> None:
+        """Creates the filter bar narrowing the listbox rows as user types"""
+        filter_label = Label(self.filter_frame, text="Filtrovať:")
+        filter_label.pack(side=LEFT)
+        self.filter_field: Entry = Entry(self.filter_frame)
+        self.filter_field.pack(side=LEFT, fill="x", expand=True)
+
+        # The listbox debounces the keystrokes on its own
+        self.filter_field.bind(
+            "<KeyRelease>",
+            lambda event: self.listbox.request_filter(self.filter_field.get()),
+        )
 
     def _build_menus(self) -> None:
         """Instantiates and populates menu bar with functional elements"""
@@ -121,6 +230,10 @@ class ContactManager:
             label="Importovať kontakty z VCard 3.0 súboru",
             command=self._import_contacts,
         )
+        action_menu.add_command(
+            label="Importovať kontakty z priečinka VCard 3.0 súborov",
+            command=self._import_contacts_directory,
+        )
         action_menu.add_command(
             label="Exportovať kontakty do VCard 3.0 súboru",
             command=self._export_contacts,
@@ -218,13 +331,11 @@ class ContactManager:
                 args.append(widget.get())
         new_person = Person(*args)
 
-        # Validate the data, pass them to the DAO and add among loaded contacts
+        # Validate the data, pass them to the model to save and display them
         if new_person.validate():
-            self.dao.save(new_person)
-            self.contacts.append(new_person)
+            self.model.add(new_person)
 
-            # Reload the listbox and destroy the contact_creator_window
-            self.listbox.load_data([x.get_tuple_data() for x in self.contacts])
+            # Destroy the contact_creator_window
             self.contact_creator_window.destroy()
         else:
             messagebox.showerror(
@@ -246,22 +357,18 @@ class ContactManager:
         each member of the list will serve as a source of data and be saved if
         valid
         """
-        # Validate the data, pass them to the DAO and add among loaded contacts
+        # Validate the data, pass the valid ones to the model at once
+        valid_contacts = []
         for contact in contacts_to_save:
             if contact.validate():
-                self.dao.save(contact)
-                self.contacts.append(contact)
-
-                # Reload the listbox
-                self.listbox.load_data(
-                    [x.get_tuple_data() for x in self.contacts]
-                )
+                valid_contacts.append(contact)
             else:
                 messagebox.showerror(
                     "Error",
                     "Niektorý z údajov nie je platný!\n"
                     "Prekontrolujte ich a skúste to ešte raz!",
                 )
+        self.model.add_many(valid_contacts)
 
     def _edit_contact(self) -> None:
         """Commands the initiation of contact edit process"""
@@ -332,13 +439,16 @@ class ContactManager:
 
         # Validate the new data
         if person.validate():
-            # Pass the new data to the DAO and save it, delete the old one
-            self.dao.save(person)
-            self.dao._delete_contact(self.person_being_edited)
+            # Pass the new data to the model to replace the old one
+            if not self.model.update(self.person_being_edited, person):
+                messagebox.showerror(
+                    "Error",
+                    "Kontakt sa v databáze nenašiel!\n"
+                    "Mohol byť medzičasom zmenený alebo vymazaný.",
+                )
+                return
 
-            # Reload the contacts and listbox, destroy the window
-            self.contacts = self._load_contacts()
-            self.listbox.load_data([x.get_tuple_data() for x in self.contacts])
+            # Destroy the window
             self.contact_editor_window.destroy()
         else:
             messagebox.showerror(
@@ -352,20 +462,26 @@ class ContactManager:
 
     def _delete_contact(self) -> None:
         """Commands the initiation of contact deletion process"""
-        # Instatiate the person selected in listbox
-        person = self._get_selected_person()
+        # Instatiate the persons selected in listbox
+        persons = self._get_selected_persons()
+        if persons == []:
+            return
 
         # Pop up a deletion confirmation window
         if messagebox.askyesno(
             "Warning",
-            "Naozaj si prajete vymazať nasledujúci kontakt:\n{}?".format(
-                person.name
+            "Naozaj si prajete vymazať nasledujúce kontakty:\n{}?".format(
+                ", ".join(x.name for x in persons)
             ),
         ):
-            # Delete the contact, reload the contacts and listbox
-            self.dao._delete_contact(person)
-            self.contacts = self._load_contacts()
-            self.listbox.load_data([x.get_tuple_data() for x in self.contacts])
+            # Delete the contacts at once
+            deleted = self.model.remove_many(persons)
+            if len(deleted) < len(persons):
+                messagebox.showwarning(
+                    "Warning",
+                    "Niektoré kontakty sa v databáze nenašli,\n"
+                    "vymazaných kontaktov: {}".format(len(deleted)),
+                )
 
     def _import_contacts(self) -> None:
         """Commands the initiation of contact import process
@@ -378,6 +494,74 @@ class ContactManager:
         new_contacts = self._load_contacts(import_path)
         self._request_multiple_contact_save(new_contacts)
 
+    def _import_contacts_directory(self) -> None:
+        """Commands the initiation of directory import process
+
+        Opens the directory dialog where user picks a directory of .vcf
+        files, parses them in parallel off the Tk thread, saves the valid
+        new contacts at once and reports the files which couldn't be imported
+        """
+        if self.import_future is not None:
+            messagebox.showinfo("Import", "Import práve prebieha!")
+            return
+        import_directory = filedialog.askdirectory()
+        if not import_directory:
+            return
+
+        # Tk isn't thread-safe, the worker only records the progress
+        def report_progress(done: int, total: int) -> None:
+            self.import_progress = (done, total)
+
+        # The contacts are saved from the Tk thread, like all the others
+        importer = DirectoryImporter(self.dao)
+        self.import_progress = (0, 0)
+        self.import_future = self._import_executor.submit(
+            importer.import_directory,
+            import_directory,
+            self.model.contacts,
+            report_progress,
+            False,
+        )
+        self._poll_import()
+
+    def _poll_import(self) -> None:
+        """Displays the progress of the directory import in the title of
+        the main window and its result once it's finished
+        """
+        if not self.import_future.done():
+            self.window.title(
+                "Contact Manager - import {}/{}".format(*self.import_progress)
+            )
+            self.window.after(self.IMPORT_POLL_DELAY, self._poll_import)
+            return
+
+        future, self.import_future = self.import_future, None
+        self.window.title("Contact Manager")
+        try:
+            result = future.result()
+        except Exception as error:
+            messagebox.showerror("Import", str(error))
+            return
+
+        # Save the contacts at once and announce them by the model
+        self.model.add_many(result.imported)
+
+        message = (
+            "Importovaných kontaktov: {}\n"
+            "Neplatných kontaktov: {}\n"
+            "Duplicitných kontaktov: {}".format(
+                len(result.imported), len(result.invalid), result.duplicates
+            )
+        )
+        if result.errors != []:
+            message += "\nSúbory, ktoré sa nepodarilo načítať:\n"
+            message += "\n".join(
+                "{}: {}".format(path, error) for path, error in result.errors
+            )
+            messagebox.showwarning("Import", message)
+        else:
+            messagebox.showinfo("Import", message)
+
     def _export_contacts(self) -> None:
         """Commands the initiation of contact export process
 
@@ -399,7 +583,7 @@ class ContactManager:
         # Create search bar label and entry field
         search_label = Label(
             self.contact_searcher_window,
-            text="Zadajte meno hľadaného kontaktu",
+            text="Zadajte meno, telefónne číslo alebo e-mail kontaktu",
         )
         search_label.pack()
         search_field = Entry(self.contact_searcher_window, width=30)
@@ -415,7 +599,6 @@ class ContactManager:
 
     def _request_contact_search(self) -> None:
         """Handles request to search a contact"""
-        self.person_being_searched: Optional[Person] = None
         searched_name = None
 
         # Collect the search bar name input
@@ -423,13 +606,15 @@ class ContactManager:
             if type(widget) == Entry:
                 searched_name = widget.get()
 
-        # Check whether the entered name exists
-        for person in self.contacts:
-            if person.name == searched_name:
-                self.person_being_searched = person
+        # Look the input up as a name, a phone number or an email
+        self.search_query: Query = self.query_engine.query().where(
+            Eq("name", searched_name)
+            | PhoneIs(searched_name, self.index)
+            | EmailIs(searched_name, self.index)
+        )
 
-        # If the person was found, destroy the search window, build the viewer
-        if self.person_being_searched is not None:
+        # If anybody was found, destroy the search window, build the viewer
+        if self.search_query.first() is not None:
             self.contact_searcher_window.destroy()
             self._build_contact_viewer()
         else:
@@ -440,46 +625,104 @@ class ContactManager:
             )
 
     def _build_contact_viewer(self) -> None:
-        """Creates new window and displays the data of searched person"""
+        """Creates new window and displays the data of searched persons"""
         # New window
-        window = Toplevel()
-        window.title("Vyhľadaný kontakt")
-
-        # Create the labels and fill them with the searched person data
-        name_label = Label(window, text=self.person_being_searched.name)
-        name_label.pack(padx=50)
-        bday_label = Label(window, text=self.person_being_searched.bday)
-        bday_label.pack(padx=50)
-        email_label = Label(window, text=self.person_being_searched.email)
-        email_label.pack(padx=50)
-        phone_label = Label(window, text=self.person_being_searched.phone)
-        phone_label.pack(padx=50)
-        note_label = Label(window, text=self.person_being_searched.note)
-        note_label.pack(padx=50)
+        self.contact_viewer_window = Toplevel()
+        self.contact_viewer_window.title("Vyhľadaný kontakt")
+        self._show_search_page(0)
+
+    def _show_search_page(self, page: int) -> None:
+        """Displays one page of the search results in the viewer window
+
+        page (int): number of the page to display, starting from 0
+        """
+        window = self.contact_viewer_window
+        for widget in window.winfo_children():
+            widget.destroy()
+
+        # Fetch one more person to find out whether there's a next page
+        persons = self.search_query.offset(
+            page * self.SEARCH_PAGE_SIZE
+        ).limit(self.SEARCH_PAGE_SIZE + 1).all()
+
+        # Create the labels and fill them with the searched persons data
+        for person in persons[: self.SEARCH_PAGE_SIZE]:
+            frame = Frame(window)
+            frame.pack(pady=5)
+            for value in person.get_tuple_data():
+                Label(frame, text=value).pack(padx=50)
+
+        # Create the paging buttons
+        if page > 0:
+            previous_button = Button(
+                window,
+                text="Predchádzajúce",
+                command=lambda: self._show_search_page(page - 1),
+            )
+            previous_button.pack(side=LEFT)
+        if len(persons) > self.SEARCH_PAGE_SIZE:
+            next_button = Button(
+                window,
+                text="Ďalšie",
+                command=lambda: self._show_search_page(page + 1),
+            )
+            next_button.pack(side=RIGHT)
 
     def _get_selected_person(self) -> Person:
         """Instantiates and returns the selected person in the listbox"""
         args = self.listbox.selected_contact["values"]
         return Person(*args)
 
+    def _get_selected_persons(self) -> List[Person]:
+        """Instantiates and returns all the selected persons in the listbox"""
+        return [
+            Person(*x["values"]) for x in self.listbox.get_selected_contacts()
+        ]
+
     def _check_bday(self) -> None:
         """Checks the bday of all the contacts in the database"""
         # If no contacts are present stop checking
         self.have_bday_today = []
-        if self.contacts == []:
+        if self.model.contacts == []:
             return
 
         # Get today's date
         current_date = datetime.datetime.today().strftime("%m-%d")
 
-        # Check every contact's bday
-        for contact in self.contacts:
-            try:
-                bday_date = contact.bday.split("-", 1)[1]
-            except Exception:
-                continue
-            if bday_date == current_date:
-                self.have_bday_today.append(contact.name)
+        # Look up the contacts with today's bday
+        for contact in self.query_engine.query().where(
+            BirthdayOn(current_date)
+        ):
+            self.have_bday_today.append(contact.name)
+
+    def _update_query_engine(self, events: List[ContactEvent]) -> None:
+        """Applies a batch of change events of the model to the query
+        engine and its indexes
+        """
+        for event in events:
+            if event.kind == ADDED:
+                self.query_engine.add(event.person)
+            elif event.kind == UPDATED:
+                self.query_engine.update(event.old_person, event.person)
+            else:
+                self.query_engine.remove(event.person)
+
+    def _update_bday_reminder(self, events: List[ContactEvent]) -> None:
+        """Applies a batch of change events of the model to the list
+        of the contacts having bday today
+        """
+        current_date = datetime.datetime.today().strftime("%m-%d")
+        for event in events:
+            if event.kind in (UPDATED, REMOVED):
+                old_person = event.old_person or event.person
+                if (
+                    month_day(old_person.bday) == current_date
+                    and old_person.name in self.have_bday_today
+                ):
+                    self.have_bday_today.remove(old_person.name)
+            if event.kind in (ADDED, UPDATED):
+                if month_day(event.person.bday) == current_date:
+                    self.have_bday_today.append(event.person.name)
 
     def main(self) -> None:
         """Loads up the contacts and builds the GUI of the ContactManager"""
@@ -487,7 +730,7 @@ class ContactManager:
         ttk._convert_stringval = _convert_stringval
 
         # Prepares contact list containing all persons to display
-        self.contacts = self._load_contacts()
+        self.model.load()
 
         # Check who has bday
         self._check_bday()
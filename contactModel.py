@@ -0,0 +1,179 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dao import DAO
+from person import Person
+
+
+# Kinds of the change events
+ADDED: str = "added"
+UPDATED: str = "updated"
+REMOVED: str = "removed"
+
+
+class ContactEvent:
+    def __init__(
+        self, kind: str, person: Person, old_person: Optional[Person] = None
+    ):
+        # One of ADDED, UPDATED, REMOVED
+        self.kind = kind
+
+        # The affected contact, for UPDATED its new version
+        self.person = person
+
+        # The replaced version of the contact, only for UPDATED
+        self.old_person = old_person
+
+
+class ContactModel:
+    """The loaded contacts, every change goes through the DAO and is
+    announced to the subscribers as a batch of ContactEvents
+
+    Events carry the Person objs owned by the model, so subscribers
+    may key their state by them.
+    """
+
+    def __init__(self, dao: DAO):
+        self.dao: DAO = dao
+
+        # The contacts in the order they were added, keyed by identity,
+        # and the same contacts keyed by their data
+        self._contacts: Dict[int, Person] = {}
+        self._by_data: Dict[Tuple[str, ...], List[Person]] = {}
+
+        # Callbacks receiving the batches of events
+        self.subscribers: List[Callable[[List[ContactEvent]], None]] = []
+
+        # Events of the currently open transaction and its nesting level
+        self._pending: List[ContactEvent] = []
+        self._depth: int = 0
+
+    @property
+    def contacts(self) -> List[Person]:
+        return list(self._contacts.values())
+
+    def subscribe(
+        self, callback: Callable[[List[ContactEvent]], None]
+    ) -> None:
+        """Registers a callback receiving the batches of events"""
+        self.subscribers.append(callback)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Groups the events of all the changes made inside into one batch,
+        transactions may be nested
+        """
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._flush()
+
+    def _emit(self, event: ContactEvent) -> None:
+        self._pending.append(event)
+        if self._depth == 0:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Delivers the pending events to the subscribers"""
+        events, self._pending = self._pending, []
+        if events == []:
+            return
+        for callback in self.subscribers:
+            callback(events)
+
+    def find(self, person: Person) -> Optional[Person]:
+        """Returns the contact owned by the model with the same data
+
+        person (Person): e.g. a Person obj rebuilt from the listbox
+        """
+        if id(person) in self._contacts:
+            return person
+        persons = self._by_data.get(person.get_tuple_data())
+        return persons[0] if persons else None
+
+    def _insert(self, person: Person) -> None:
+        self._contacts[id(person)] = person
+        self._by_data.setdefault(person.get_tuple_data(), []).append(person)
+
+    def _discard(self, person: Person) -> None:
+        del self._contacts[id(person)]
+        data = person.get_tuple_data()
+        self._by_data[data].remove(person)
+        if self._by_data[data] == []:
+            del self._by_data[data]
+
+    def load(self) -> None:
+        """Loads the contacts from the database, the previously loaded
+        contacts are announced as removed and the new ones as added
+        """
+        persons = self.dao.load()
+        with self.transaction():
+            for person in self.contacts:
+                self._discard(person)
+                self._emit(ContactEvent(REMOVED, person))
+            for person in persons:
+                self._insert(person)
+                self._emit(ContactEvent(ADDED, person))
+
+    def add(self, person: Person) -> None:
+        """Saves a new contact"""
+        self.add_many([person])
+
+    def add_many(self, persons: Iterable[Person], save: bool = True) -> None:
+        """Saves new contacts by a single write
+
+        persons (Iterable[Person]): the new contacts
+        save (bool, optional): False if the contacts were already saved
+        to the database, e.g. by the directory importer
+        """
+        persons = list(persons)
+        if save:
+            self.dao.save_many(persons)
+        with self.transaction():
+            for person in persons:
+                self._insert(person)
+                self._emit(ContactEvent(ADDED, person))
+
+    def update(self, old_person: Person, new_person: Person) -> bool:
+        """Replaces a contact by its new version, returns False if it wasn't
+        found in the database
+        """
+        return self.update_many([(old_person, new_person)]) != []
+
+    def update_many(
+        self, changes: List[Tuple[Person, Person]]
+    ) -> List[Tuple[Person, Person]]:
+        """Replaces contacts by their new versions by a single rewrite,
+        returns the changes of the contacts found in the database
+        """
+        matched = self.dao.update_many(changes)
+
+        # Only the changes the database confirmed are announced
+        with self.transaction():
+            for old_person, new_person in matched:
+                old_person = self.find(old_person)
+                if old_person is None:
+                    continue
+                self._discard(old_person)
+                self._insert(new_person)
+                self._emit(ContactEvent(UPDATED, new_person, old_person))
+        return matched
+
+    def remove_many(self, persons: Iterable[Person]) -> List[Person]:
+        """Deletes contacts by a single rewrite, returns the contacts found
+        in the database
+        """
+        deleted = self.dao.delete_many(persons)
+
+        # Only the deletions the database confirmed are announced
+        with self.transaction():
+            for person in deleted:
+                person = self.find(person)
+                if person is None:
+                    continue
+                self._discard(person)
+                self._emit(ContactEvent(REMOVED, person))
+        return deleted
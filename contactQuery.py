@@ -0,0 +1,431 @@
+from itertools import islice
+from typing import (
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import re
+
+from contactIndex import ContactIndex
+from person import Person
+
+
+class Predicate:
+    """Base of all the query conditions, combine them with & and |"""
+
+    def matches(self, person: Person) -> bool:
+        raise NotImplementedError
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return And(self, other)
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Or(self, other)
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+
+class Eq(Predicate):
+    """The field equals the value"""
+
+    def __init__(self, field: str, value: str):
+        self.field = field
+        self.value = value
+
+    def matches(self, person: Person) -> bool:
+        return getattr(person, self.field) == self.value
+
+
+class Contains(Predicate):
+    """The field contains the text, case insensitive"""
+
+    def __init__(self, field: str, text: str):
+        self.field = field
+        self.text = text.lower()
+
+    def matches(self, person: Person) -> bool:
+        return self.text in (getattr(person, self.field) or "").lower()
+
+
+class IsEmpty(Predicate):
+    """The field is missing or empty"""
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def matches(self, person: Person) -> bool:
+        return not getattr(person, self.field)
+
+
+class HasWord(Predicate):
+    """The field contains the whole word, case insensitive"""
+
+    def __init__(self, field: str, word: str):
+        self.field = field
+        self.word = word.lower()
+
+    def matches(self, person: Person) -> bool:
+        return self.word in tokenize(getattr(person, self.field))
+
+
+class BirthdayOn(Predicate):
+    """The person was born on the day of year given as MM-DD"""
+
+    def __init__(self, month_day: str):
+        self.month_day = month_day
+
+    def matches(self, person: Person) -> bool:
+        return month_day(person.bday) == self.month_day
+
+
+class PhoneIs(Predicate):
+    """The phone number equals the given one after normalization"""
+
+    def __init__(self, phone: str, index: ContactIndex):
+        self.index = index
+        self.phone = index.normalize_phone(phone)
+
+    def matches(self, person: Person) -> bool:
+        return (
+            self.phone != ""
+            and self.index.normalize_phone(person.phone) == self.phone
+        )
+
+
+class EmailIs(Predicate):
+    """The email equals the given one, case insensitive"""
+
+    def __init__(self, email: str, index: ContactIndex):
+        self.index = index
+        self.email = index.normalize_email(email)
+
+    def matches(self, person: Person) -> bool:
+        return (
+            self.email != ""
+            and self.index.normalize_email(person.email) == self.email
+        )
+
+
+def _flatten(kind: type, predicates: Tuple[Predicate, ...]) -> tuple:
+    """Merges the operands of nested And (or Or) into a single level"""
+    return tuple(
+        operand
+        for predicate in predicates
+        for operand in (
+            predicate.predicates
+            if isinstance(predicate, kind)
+            else (predicate,)
+        )
+    )
+
+
+class And(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = _flatten(And, predicates)
+
+    def matches(self, person: Person) -> bool:
+        return all(x.matches(person) for x in self.predicates)
+
+
+class Or(Predicate):
+    def __init__(self, *predicates: Predicate):
+        self.predicates = _flatten(Or, predicates)
+
+    def matches(self, person: Person) -> bool:
+        return any(x.matches(person) for x in self.predicates)
+
+
+class Not(Predicate):
+    def __init__(self, predicate: Predicate):
+        self.predicate = predicate
+
+    def matches(self, person: Person) -> bool:
+        return not self.predicate.matches(person)
+
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Returns the lowercased words of a text"""
+    return _WORD.findall((text or "").lower())
+
+
+def month_day(bday: Optional[str]) -> str:
+    """Returns the MM-DD part of a YYYY-MM-DD birthday, or an empty string"""
+    try:
+        return bday.split("-", 1)[1]
+    except (AttributeError, IndexError):
+        return ""
+
+
+class Query:
+    def __init__(self, engine: "QueryEngine"):
+        self.engine = engine
+        self.predicate: Optional[Predicate] = None
+        self.sort_keys: List[Tuple[str, bool]] = []
+        self.fields: Optional[Sequence[str]] = None
+        self.limit_count: Optional[int] = None
+        self.offset_count: int = 0
+
+    def _copy(self) -> "Query":
+        """Queries are immutable, every refinement returns a new one"""
+        query = Query(self.engine)
+        query.predicate = self.predicate
+        query.sort_keys = list(self.sort_keys)
+        query.fields = self.fields
+        query.limit_count = self.limit_count
+        query.offset_count = self.offset_count
+        return query
+
+    def where(self, predicate: Predicate) -> "Query":
+        """Narrows the query, multiple calls are combined with AND"""
+        query = self._copy()
+        if query.predicate is None:
+            query.predicate = predicate
+        else:
+            query.predicate = And(query.predicate, predicate)
+        return query
+
+    def order_by(self, field: str, descending: bool = False) -> "Query":
+        """Sorts the results by the field, case insensitive
+
+        Multiple calls add secondary sort keys
+        """
+        query = self._copy()
+        query.sort_keys.append((field, descending))
+        return query
+
+    def select(self, *fields: str) -> "Query":
+        """Returns tuples of the given fields instead of Person objs"""
+        query = self._copy()
+        query.fields = fields
+        return query
+
+    def limit(self, count: int) -> "Query":
+        query = self._copy()
+        query.limit_count = count
+        return query
+
+    def offset(self, count: int) -> "Query":
+        query = self._copy()
+        query.offset_count = count
+        return query
+
+    def __iter__(self) -> Iterator[Union[Person, Tuple[str, ...]]]:
+        """Lazily evaluates the query, only sorting needs all the matches"""
+        persons: Iterable[Person] = self.engine.execute(self.predicate)
+
+        # Stable sorts applied from the least significant key
+        if self.sort_keys != []:
+            persons = list(persons)
+            for field, descending in reversed(self.sort_keys):
+                persons.sort(
+                    key=lambda x: (getattr(x, field) or "").lower(),
+                    reverse=descending,
+                )
+
+        stop = None
+        if self.limit_count is not None:
+            stop = self.offset_count + self.limit_count
+        persons = islice(persons, self.offset_count, stop)
+
+        if self.fields is None:
+            return iter(persons)
+        fields = self.fields
+        return (tuple(getattr(x, f) for f in fields) for x in persons)
+
+    def all(self) -> List[Union[Person, Tuple[str, ...]]]:
+        return list(self)
+
+    def first(self) -> Optional[Union[Person, Tuple[str, ...]]]:
+        return next(iter(self.limit(1)), None)
+
+    def explain(self) -> str:
+        """Describes the way the planner is going to evaluate the query"""
+        return self.engine.explain(self.predicate)
+
+
+class QueryEngine:
+    def __init__(self, index: Optional[ContactIndex] = None):
+        # All the contacts in the order they were added, keyed by identity,
+        # and the same contacts keyed by their data
+        self.contacts: Dict[int, Person] = {}
+        self._by_data: Dict[Tuple[str, ...], List[Person]] = {}
+
+        # Indexes: exact name, MM-DD birthday, phone/email, words of the text,
+        # the buckets are keyed by identity, so removal doesn't scan them
+        self.index: ContactIndex = (
+            index if index is not None else ContactIndex()
+        )
+        self.names: Dict[str, Dict[int, Person]] = {}
+        self.birthdays: Dict[str, Dict[int, Person]] = {}
+        self.words: Dict[str, Dict[int, Person]] = {}
+
+        # Fields whose words are indexed for HasWord predicates
+        self.TEXT_FIELDS: Tuple[str, ...] = ("name", "note")
+
+    def query(self) -> Query:
+        """Returns a new query over all the contacts"""
+        return Query(self)
+
+    def build(self, contacts: Iterable[Person]) -> None:
+        """Rebuilds the contacts and all the indexes"""
+        self.contacts = {}
+        self._by_data = {}
+        self.names = {}
+        self.birthdays = {}
+        self.words = {}
+        self.index.build([])
+        for person in contacts:
+            self.add(person)
+
+    def add(self, person: Person) -> None:
+        """Adds a single person to the contacts and indexes"""
+        key = id(person)
+        self.contacts[key] = person
+        self._by_data.setdefault(person.get_tuple_data(), []).append(person)
+        self.index.add(person)
+        self.names.setdefault(person.name, {})[key] = person
+        bday = month_day(person.bday)
+        if bday != "":
+            self.birthdays.setdefault(bday, {})[key] = person
+        for word in self._words_of(person):
+            self.words.setdefault(word, {})[key] = person
+
+    def remove(self, person: Person) -> None:
+        """Removes a single person from the contacts and indexes
+
+        Persons are matched by identity, or by their data if the Person obj
+        isn't indexed, e.g. if it was rebuilt from a request
+        """
+        if id(person) not in self.contacts:
+            persons = self._by_data.get(person.get_tuple_data())
+            if not persons:
+                return
+            person = persons[0]
+
+        key = id(person)
+        del self.contacts[key]
+        data = person.get_tuple_data()
+        self._by_data[data].remove(person)
+        if self._by_data[data] == []:
+            del self._by_data[data]
+        self.index.remove(person)
+        self._remove_from_table(self.names, person.name, key)
+        self._remove_from_table(self.birthdays, month_day(person.bday), key)
+        for word in self._words_of(person):
+            self._remove_from_table(self.words, word, key)
+
+    def update(self, old_person: Person, new_person: Person) -> None:
+        """Replaces the old version of a person with the new one"""
+        self.remove(old_person)
+        self.add(new_person)
+
+    def _words_of(self, person: Person) -> set:
+        """Returns the distinct indexed words of a person"""
+        return {
+            word
+            for field in self.TEXT_FIELDS
+            for word in tokenize(getattr(person, field))
+        }
+
+    def _remove_from_table(
+        self, table: Dict[str, Dict[int, Person]], key: str, person_key: int
+    ) -> None:
+        bucket = table.get(key)
+        if bucket is None:
+            return
+        bucket.pop(person_key, None)
+        if bucket == {}:
+            del table[key]
+
+    def _plan(
+        self, predicate: Optional[Predicate]
+    ) -> Tuple[Optional[Collection[Person]], str]:
+        """Picks the candidates out of the indexes, if there's any usable
+
+        Returns the candidates (None means a full scan) and a description
+        of the plan. The candidates are a superset of the matches.
+        """
+        if isinstance(predicate, Eq) and predicate.field == "name":
+            return self.names.get(predicate.value, {}).values(), "name index"
+        # Contacts without a valid birthday aren't in the birthday index,
+        # so it can only answer for a valid one
+        if (
+            isinstance(predicate, Eq)
+            and predicate.field == "bday"
+            and month_day(predicate.value) != ""
+        ):
+            return (
+                self.birthdays.get(month_day(predicate.value), {}).values(),
+                "birthday index",
+            )
+        if isinstance(predicate, BirthdayOn):
+            return (
+                self.birthdays.get(predicate.month_day, {}).values(),
+                "birthday index",
+            )
+        if isinstance(predicate, PhoneIs):
+            return self.index.phones.get(predicate.phone, []), "phone index"
+        if isinstance(predicate, EmailIs):
+            return self.index.emails.get(predicate.email, []), "email index"
+        if (
+            isinstance(predicate, HasWord)
+            and predicate.field in self.TEXT_FIELDS
+        ):
+            return self.words.get(predicate.word, {}).values(), "text index"
+
+        # AND: the smallest set of candidates of the indexed operands
+        if isinstance(predicate, And):
+            best: Tuple[Optional[Collection[Person]], str] = (None, "scan")
+            for child in predicate.predicates:
+                candidates, plan = self._plan(child)
+                if candidates is not None and (
+                    best[0] is None or len(candidates) < len(best[0])
+                ):
+                    best = (candidates, plan)
+            return best
+
+        # OR: the union of candidates, only if every operand is indexed
+        if isinstance(predicate, Or):
+            union: List[Person] = []
+            seen = set()
+            plans = []
+            for child in predicate.predicates:
+                candidates, plan = self._plan(child)
+                if candidates is None:
+                    return None, "scan"
+                plans.append(plan)
+                for person in candidates:
+                    if id(person) not in seen:
+                        seen.add(id(person))
+                        union.append(person)
+            return union, "union of " + ", ".join(plans)
+
+        return None, "scan"
+
+    def execute(self, predicate: Optional[Predicate]) -> Iterator[Person]:
+        """Lazily yields the contacts matching the predicate"""
+        if predicate is None:
+            return iter(list(self.contacts.values()))
+        candidates, _ = self._plan(predicate)
+        if candidates is None:
+            candidates = self.contacts.values()
+
+        # Snapshot, so the query isn't affected by mutations mid-iteration
+        matches: Callable[[Person], bool] = predicate.matches
+        return (x for x in list(candidates) if matches(x))
+
+    def explain(self, predicate: Optional[Predicate]) -> str:
+        if predicate is None:
+            return "scan"
+        return self._plan(predicate)[1]
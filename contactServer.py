@@ -0,0 +1,353 @@
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import re
+
+from contactQuery import BirthdayOn, Eq, QueryEngine
+from dao import DAO
+from person import Person
+
+
+# Operations answered out of the resident indexes
+LOOKUPS = ("name", "phone", "email", "birthday")
+
+# Operations changing the database
+MUTATIONS = ("add", "update", "delete")
+
+# Keys of the JSON representation of a person
+FIELDS = ("name", "bday", "email", "phone", "note")
+
+# Values accepted by the birthday lookup: MM-DD or a whole YYYY-MM-DD date
+BIRTHDAY = re.compile("^([0-9]{4}-)?[0-9]{2}-[0-9]{2}$")
+
+
+def person_to_dict(person: Person) -> Dict[str, str]:
+    """Returns the JSON representation of a person"""
+    return dict(zip(FIELDS, person.get_tuple_data()))
+
+
+def dict_to_person(data: Any) -> Person:
+    """Builds a person out of its JSON representation
+
+    Raises ValueError if the data isn't a valid JSON representation
+    """
+    if (
+        not isinstance(data, dict)
+        or not isinstance(data.get("name"), str)
+        or not all(isinstance(data.get(x, ""), str) for x in FIELDS)
+    ):
+        raise ValueError("A contact must be an object of strings with a name")
+    return Person(
+        data["name"],
+        data.get("bday", ""),
+        data.get("email", ""),
+        data.get("phone", ""),
+        data.get("note", ""),
+    )
+
+
+class ContactServer:
+    """Local contact lookup service speaking line-delimited JSON
+
+    Every request is a JSON object on its own line, e.g.
+    {"id": 1, "op": "phone", "value": "0905 123 456"} or
+    {"id": 2, "op": "update", "old": {...}, "new": {...}}
+    and gets a response line {"id": 1, "ok": true, "contacts": [...]}.
+    The birthday lookup takes MM-DD, or a YYYY-MM-DD date whose year is
+    ignored, and finds the contacts born on that day of any year.
+    Concurrent lookups are answered in batches and concurrent mutations
+    are written to the database at once.
+    """
+
+    def __init__(self, dao: DAO):
+        # The DAO and the resident contacts with their indexes
+        self.dao: DAO = dao
+        self.query_engine: QueryEngine = QueryEngine()
+
+        # Requests waiting for the batcher and the committer
+        self.lookups: "asyncio.Queue[Tuple[str, str, asyncio.Future]]"
+        self.mutations: "asyncio.Queue[Tuple[str, Tuple, asyncio.Future]]"
+
+        # Upper bound of the number of requests handled in one batch
+        self.MAX_BATCH: int = 1024
+
+        # The batcher and committer tasks
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        socket_path: Optional[str] = None,
+    ) -> asyncio.AbstractServer:
+        """Loads the contacts and starts serving on TCP or a Unix socket"""
+        loop = asyncio.get_running_loop()
+        contacts = await loop.run_in_executor(None, self.dao.load)
+        self.query_engine.build(contacts)
+
+        self.lookups = asyncio.Queue()
+        self.mutations = asyncio.Queue()
+        self.tasks = [
+            asyncio.ensure_future(self._batch_lookups()),
+            asyncio.ensure_future(self._commit_mutations()),
+        ]
+
+        if socket_path is not None:
+            return await asyncio.start_unix_server(
+                self._handle_client, path=socket_path
+            )
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Reads the requests of a client, requests may be pipelined and
+        their responses are written as soon as they are ready
+        """
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def _respond(
+        self, line: bytes, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answers a single request line"""
+        response: Dict[str, Any] = {"id": None}
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                response["id"] = request.get("id")
+            response["contacts"] = await self.handle(request)
+            response["ok"] = True
+        except Exception as error:
+            response["ok"] = False
+            response["error"] = str(error)
+        writer.write(json.dumps(response).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def handle(self, request: Any) -> List[Dict[str, str]]:
+        """Validates the request, queues it for its batch and waits for
+        the result, an invalid request raises ValueError
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A request must be an object")
+        op = request.get("op")
+        future = asyncio.get_running_loop().create_future()
+        if op in LOOKUPS:
+            value = request.get("value")
+            if not isinstance(value, str):
+                raise ValueError("The value of a lookup must be a string")
+            if op == "birthday":
+                if not BIRTHDAY.match(value):
+                    raise ValueError("A birthday must be MM-DD or YYYY-MM-DD")
+                value = value[-5:]
+            await self.lookups.put((op, value, future))
+        elif op in MUTATIONS:
+            # The contacts are parsed here, so the committer gets only
+            # the valid ones
+            if op == "update":
+                change = (
+                    dict_to_person(request.get("old")),
+                    dict_to_person(request.get("new")),
+                )
+            else:
+                change = (dict_to_person(request.get("contact")), None)
+            await self.mutations.put((op, change, future))
+        else:
+            raise ValueError("Unknown operation: {}".format(op))
+        return await future
+
+    async def _drain(self, queue: asyncio.Queue) -> List[Tuple]:
+        """Waits for a request and takes whatever else is queued with it"""
+        batch = [await queue.get()]
+
+        # Let the other ready requests join the batch
+        await asyncio.sleep(0)
+        while len(batch) < self.MAX_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def _batch_lookups(self) -> None:
+        """Answers the queued lookups in batches, every distinct key
+        is looked up just once per batch
+        """
+        while True:
+            batch = await self._drain(self.lookups)
+            keys: Dict[Tuple[str, str], List[asyncio.Future]] = {}
+            for op, value, future in batch:
+                keys.setdefault((op, value), []).append(future)
+            try:
+                self._answer_lookups(keys)
+            except Exception as error:
+                # The batcher keeps running, only this batch fails
+                for futures in keys.values():
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(error)
+
+    def _answer_lookups(
+        self, keys: Dict[Tuple[str, str], List[asyncio.Future]]
+    ) -> None:
+        """Answers a batch of lookups grouped by their distinct keys"""
+        # Phones and emails are looked up by the batch API of the index
+        index = self.query_engine.index
+        phones = index.lookup_phones(
+            value for op, value in keys if op == "phone"
+        )
+        emails = index.lookup_emails(
+            value for op, value in keys if op == "email"
+        )
+        for (op, value), futures in keys.items():
+            if op == "phone":
+                persons = phones[value]
+            elif op == "email":
+                persons = emails[value]
+            elif op == "name":
+                persons = self.query_engine.query().where(
+                    Eq("name", value)
+                ).all()
+            else:
+                persons = self.query_engine.query().where(
+                    BirthdayOn(value)
+                ).all()
+            result = [person_to_dict(x) for x in persons]
+            for future in futures:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _commit_mutations(self) -> None:
+        """Writes the queued mutations to the database in as few writes
+        as their order allows (group commit), the requests are answered
+        after their write is done
+        """
+        while True:
+            batch = await self._drain(self.mutations)
+            valid = []
+            for op, change, future in batch:
+                person = change[0] if op != "update" else change[1]
+                if op != "delete" and not person.validate():
+                    future.set_exception(ValueError("Invalid contact"))
+                    continue
+                valid.append((op, change, future))
+            for run in self._split_runs(valid):
+                await self._commit_run(run)
+
+    def _split_runs(
+        self, batch: List[Tuple[str, Tuple, asyncio.Future]]
+    ) -> List[List[Tuple[str, Tuple, asyncio.Future]]]:
+        """Splits the mutations into runs written one after another, so
+        the mutations take effect in the order they were requested
+
+        A run holds either additions or changes, and a change of a contact
+        written earlier in the run, e.g. deletion of an updated contact,
+        starts a new run
+        """
+        runs: List[List[Tuple[str, Tuple, asyncio.Future]]] = []
+        written = set()
+        for mutation in batch:
+            op, change, _ = mutation
+            if (
+                runs == []
+                or (runs[-1][0][0] == "add") != (op == "add")
+                or (op != "add" and change[0].get_tuple_data() in written)
+            ):
+                runs.append([])
+                written = set()
+            runs[-1].append(mutation)
+            if op == "update":
+                written.add(change[1].get_tuple_data())
+        return runs
+
+    async def _commit_run(
+        self, run: List[Tuple[str, Tuple, asyncio.Future]]
+    ) -> None:
+        """Writes a run of mutations at once and answers their requests"""
+        additions: List[Person] = []
+        changes: List[Tuple[Person, Optional[Person]]] = []
+        for op, change, _ in run:
+            if op == "add":
+                additions.append(change[0])
+            else:
+                changes.append(change)
+
+        loop = asyncio.get_running_loop()
+        try:
+            matched = await loop.run_in_executor(
+                None, self._write, additions, changes
+            )
+        except Exception as error:
+            for _, _, future in run:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        # Apply the written mutations to the resident contacts and
+        # indexes, the changes of contacts not found are refused
+        matched_ids = {id(x) for x in matched}
+        for person in additions:
+            self.query_engine.add(person)
+        for old_person, new_person in matched:
+            if new_person is None:
+                self.query_engine.remove(old_person)
+            else:
+                self.query_engine.update(old_person, new_person)
+        for op, change, future in run:
+            if future.done():
+                continue
+            if op != "add" and id(change) not in matched_ids:
+                future.set_exception(ValueError("Contact not found"))
+            else:
+                person = change[0] if op != "update" else change[1]
+                future.set_result([person_to_dict(person)])
+
+    def _write(
+        self,
+        additions: List[Person],
+        changes: List[Tuple[Person, Optional[Person]]],
+    ) -> List[Tuple[Person, Optional[Person]]]:
+        """Writes a batch of mutations by the DAO, runs off the event loop,
+        returns the changes of the contacts found in the database
+        """
+        matched: List[Tuple[Person, Optional[Person]]] = []
+        if changes != []:
+            matched = self.dao.update_many(changes)
+        if additions != []:
+            self.dao.save_many(additions)
+        return matched
+
+
+def main() -> None:
+    """Runs the contact lookup service until interrupted"""
+    parser = argparse.ArgumentParser(description="Contact lookup service")
+    parser.add_argument("database", help="the database to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="serve on this Unix socket instead")
+    args = parser.parse_args()
+
+    async def serve() -> None:
+        server = await ContactServer(DAO(args.database)).start(
+            args.host, args.port, args.socket
+        )
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
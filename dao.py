@@ -1,13 +1,31 @@
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 import vobject
 import shutil
+import json
+import os
+import io
+import tempfile
+import zlib
 
+from compressedStorage import CompressedStorage, is_compressed
 from person import Person
+from vcardSerializer import VCardSerializer
 
 
 class DAO:
     def __init__(self, default_path: str):
-        # A path to the default database
+        # A path to the default database: either a single vCard file or
+        # a directory of shard files described by a manifest
         self.default_path: str = default_path
 
         # Default encoding of the database's files
@@ -17,54 +35,87 @@ class DAO:
         # the database was conflicting with vObject serialization ...
         self.NEWLINE: str = ""
 
+        # Serializes persons to vCard strings, caching the serialized cards
+        self.serializer: VCardSerializer = VCardSerializer()
+
+        # Sharded database layout, contacts are spread across the shard files
+        # by a hash of their name
+        self.MANIFEST: str = "manifest.json"
+        self.SHARD_NAME: str = "shard-{:03d}.txt"
+        self.shard_count: Optional[int] = None
+        if os.path.isdir(default_path):
+            self.shard_count = self._read_manifest(default_path)
+
     def load(self, path: str = "") -> List[Person]:
         """Load contacts from the database
 
         path (str, optional): specify path to load from,
         otherwise load from the default file specified by self.default_path
         """
-        person_list = []
         path = self.default_path if path == "" else path
+        if os.path.isdir(path):
+            return self._load_shards(path)
+
+        # Compressed database is parsed block by block
+        if is_compressed(path):
+            person_list = []
+            for text in CompressedStorage(path, self.ENCODING).iter_blocks():
+                person_list.extend(self._parse_vcards(text))
+            return person_list
 
         with open(path, encoding=self.ENCODING, newline=self.NEWLINE) as file:
-            # Read the database and create a vCard iterator
-            file_string = file.read()
-            vcard_iterator = vobject.readComponents(file_string)
-            vcard = next(vcard_iterator, None)
+            # Read the database
+            return self._parse_vcards(file.read())
 
-            # From vCard iterator extract the data to contruct a Person obj
-            while vcard:
-                try:
-                    name = vcard.contents["fn"][0].value
-                except KeyError:
-                    continue
-                try:
-                    bday = vcard.contents["bday"][0].value
-                except KeyError:
-                    bday = None
-                try:
-                    email = vcard.contents["email"][0].value
-                except KeyError:
-                    email = None
-                try:
-                    phone = vcard.contents["tel"][0].value
-                except KeyError:
-                    phone = None
-                try:
-                    note = vcard.contents["note"][0].value
-                except KeyError:
-                    note = None
-
-                # Person instantiation
-                attrs = [
-                    x
-                    for x in (name, bday, email, phone, note)
-                    if x is not None
-                ]
-                if attrs != []:
-                    person_list.append(Person(*attrs))
+    def _parse_vcards(self, file_string: str) -> List[Person]:
+        """Parses the vCards of a string into a list of persons
 
+        file_string (str): vCard formatted text
+        """
+        person_list = []
+
+        # Create a vCard iterator
+        vcard_iterator = vobject.readComponents(file_string)
+        vcard = next(vcard_iterator, None)
+
+        # From vCard iterator extract the data to contruct a Person obj
+        while vcard:
+            try:
+                name = vcard.contents["fn"][0].value
+            except KeyError:
+                # A card without a name isn't a contact, skip it
                 vcard = next(vcard_iterator, None)
+                continue
+            try:
+                bday = vcard.contents["bday"][0].value
+            except KeyError:
+                bday = None
+            try:
+                email = vcard.contents["email"][0].value
+            except KeyError:
+                email = None
+            try:
+                phone = vcard.contents["tel"][0].value
+            except KeyError:
+                phone = None
+            try:
+                note = vcard.contents["note"][0].value
+            except KeyError:
+                note = None
+
+            # Person instantiation, a missing field stays empty instead of
+            # shifting the following ones
+            person_list.append(
+                Person(
+                    name,
+                    bday=bday or "",
+                    email=email or "",
+                    phone=phone or "",
+                    note=note or "",
+                )
+            )
+
+            vcard = next(vcard_iterator, None)
         return person_list
 
     def save(self, person: Person) -> None:
@@ -74,38 +125,48 @@ class DAO:
         """
         # Get a vCard string representation of a Person obj, save it
         vcard_str = self._transform_person_to_vcard_string(person)
+        self._append(self._get_path(person), [vcard_str])
+
+    def save_many(self, persons: Iterable[Person]) -> None:
+        """Save the specified persons to the database
+
+        Every affected file is written just once
+
+        persons (Iterable[Person]): persons to save
+        """
+        vcard_strs: Dict[str, List[str]] = {}
+        for person in persons:
+            vcard_strs.setdefault(self._get_path(person), []).append(
+                self._transform_person_to_vcard_string(person)
+            )
+        for path, path_vcard_strs in vcard_strs.items():
+            self._append(path, path_vcard_strs)
+
+    def _append(self, path: str, vcard_strs: List[str]) -> None:
+        """Appends the vCard strings to the end of a database file
+
+        path (str): the file to append to
+        vcard_strs (List[str]): serialized contacts to append
+        """
+        # Compressed database gets a fresh tail block
+        if is_compressed(path):
+            CompressedStorage(path, self.ENCODING).append(vcard_strs)
+            return
+
         with open(
-            self.default_path,
+            path,
             "a",
             encoding=self.ENCODING,
             newline=self.NEWLINE,
         ) as file:
-            file.write(vcard_str)
+            file.write("".join(vcard_strs))
 
     def _transform_person_to_vcard_string(self, person: Person) -> str:
         """Transforms a Person obj to a vCard standardized string
 
         person (Person): a Person obj to transform
         """
-        # Create vCard fields to fill in later
-        vcard = vobject.vCard()
-        vcard.add("n")
-        vcard.add("fn")
-        vcard.add("bday")
-        vcard.add("email")
-        vcard.add("tel")
-        vcard.add("note")
-
-        # Fill in the attributes of the person
-        vcard.n.value = vobject.vcard.Name(family="", given="")
-        vcard.fn.value = person.name
-        vcard.bday.value = person.bday
-        vcard.email.value = person.email
-        vcard.tel.value = person.phone
-        vcard.note.value = person.note
-
-        # Generate and return the vCard string
-        return vcard.serialize()
+        return self.serializer.serialize(person)
 
     def _delete_contact(self, person: Person) -> None:
         """Deletes a specified Person obj from the database
@@ -114,8 +175,13 @@ class DAO:
         """
         # Generates a vCard string for the given person
         vcard_str = self._transform_person_to_vcard_string(person)
+        path = self._get_path(person)
+        if is_compressed(path):
+            self._rewrite(path, {vcard_str: [(0, None)]})
+            return
+
         with open(
-            self.default_path,
+            path,
             "r+",
             encoding=self.ENCODING,
             newline=self.NEWLINE,
@@ -134,6 +200,207 @@ class DAO:
             file.write(new_db)
             file.truncate()
 
+    def delete_many(self, persons: Iterable[Person]) -> List[Person]:
+        """Deletes the specified Person objs from the database
+
+        Every affected file is streamed and rewritten just once,
+        returns the persons that were found and deleted
+
+        persons (Iterable[Person]): Person objs to delete
+        """
+        changes = self.update_many([(person, None) for person in persons])
+        return [person for person, _ in changes]
+
+    def update_many(
+        self, changes: Iterable[Tuple[Person, Optional[Person]]]
+    ) -> List[Tuple[Person, Optional[Person]]]:
+        """Replaces the specified Person objs in the database by new ones
+
+        Every affected file is streamed once into a temporary file, which
+        then atomically replaces it. Returns the changes whose person was
+        found and replaced, the persons not found are left out and their
+        new versions aren't written.
+
+        changes (Iterable[Tuple[Person, Optional[Person]]]): pairs of the
+        person to replace and its new version, None deletes the person
+        """
+        changes = list(changes)
+
+        # Card strings to look for in every file -> indexes of the changes
+        # and the cards to write instead
+        replacements: Dict[
+            str, Dict[Hashable, List[Tuple[int, Optional[str]]]]
+        ] = {}
+        appends: Dict[int, Tuple[str, str]] = {}
+        for x, (old_person, new_person) in enumerate(changes):
+            old_path = self._get_path(old_person)
+            new_str = None
+            if new_person is not None:
+                new_str = self._transform_person_to_vcard_string(new_person)
+
+                # A renamed person may belong to another shard
+                new_path = self._get_path(new_person)
+                if new_path != old_path:
+                    appends[x] = (new_path, new_str)
+                    new_str = None
+            old_str = self._transform_person_to_vcard_string(old_person)
+            replacements.setdefault(old_path, {}).setdefault(
+                old_str, []
+            ).append((x, new_str))
+
+        matched: List[int] = []
+        for path, file_replacements in replacements.items():
+            matched += self._rewrite(path, file_replacements)
+
+            # Cards written by other applications differ from ours, those
+            # are looked up once more, by their data
+            left = [x for subs in file_replacements.values() for x in subs]
+            if left != []:
+                matched += self._rewrite_by_data(path, changes, left)
+
+        vcard_strs: Dict[str, List[str]] = {}
+        for x in sorted(matched):
+            if x in appends:
+                new_path, new_str = appends[x]
+                vcard_strs.setdefault(new_path, []).append(new_str)
+        for path, path_vcard_strs in vcard_strs.items():
+            self._append(path, path_vcard_strs)
+        return [changes[x] for x in sorted(matched)]
+
+    def _rewrite_by_data(
+        self,
+        path: str,
+        changes: List[Tuple[Person, Optional[Person]]],
+        left: List[Tuple[int, Optional[str]]],
+    ) -> List[int]:
+        """Rewrites the file, substituting the cards holding the same data
+        as the persons of the changes left, returns indexes of the changes
+        """
+        replacements: Dict[Hashable, List[Tuple[int, Optional[str]]]] = {}
+        names = set()
+        for x, new_str in left:
+            person = changes[x][0]
+            replacements.setdefault(person.get_tuple_data(), []).append(
+                (x, new_str)
+            )
+            names.update((person.name, self.serializer.escape(person.name)))
+
+        def card_data(vcard_str: str) -> Optional[Hashable]:
+            # Only the cards mentioning any of the names are parsed
+            unfolded = vcard_str.replace("\r\n ", "").replace("\n ", "")
+            if not any(name in unfolded for name in names):
+                return None
+            persons = self._parse_vcards(vcard_str)
+            if len(persons) != 1:
+                return None
+            return persons[0].get_tuple_data()
+
+        return self._rewrite(path, replacements, card_data)
+
+    def _rewrite(
+        self,
+        path: str,
+        replacements: Dict[Hashable, List[Tuple[int, Optional[str]]]],
+        key: Optional[Callable[[str], Optional[Hashable]]] = None,
+    ) -> List[int]:
+        """Streams the file card by card, substituting the cards found among
+        the replacements, and atomically swaps the result into its place
+
+        path (str): the file to rewrite
+        replacements (Dict): key of a card -> indexes of the changes and
+        cards to write instead of its occurrences, None drops the occurrence
+        key (Callable, optional): maps a card string to its key, the card
+        string itself is the key by default
+        """
+        if is_compressed(path):
+            return self._rewrite_compressed(path, replacements, key)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        target = tempfile.NamedTemporaryFile(
+            "w",
+            encoding=self.ENCODING,
+            newline=self.NEWLINE,
+            dir=directory,
+            delete=False,
+        )
+        try:
+            with target, open(
+                path, encoding=self.ENCODING, newline=self.NEWLINE
+            ) as source:
+                matched = self._substitute_cards(
+                    source, replacements, target.write, key
+                )
+            shutil.copymode(path, target.name)
+            os.replace(target.name, path)
+        except BaseException:
+            # No half written temporary file is left behind
+            if os.path.exists(target.name):
+                os.remove(target.name)
+            raise
+        return matched
+
+    def _rewrite_compressed(
+        self,
+        path: str,
+        replacements: Dict[Hashable, List[Tuple[int, Optional[str]]]],
+        key: Optional[Callable[[str], Optional[Hashable]]] = None,
+    ) -> List[int]:
+        """Compressed variant of _rewrite, only the blocks holding any of
+        the cards to replace are recompressed
+        """
+        matched: List[int] = []
+
+        def substitute(text: str) -> Optional[str]:
+            output: List[str] = []
+            found = self._substitute_cards(
+                io.StringIO(text, newline=self.NEWLINE),
+                replacements,
+                output.append,
+                key,
+            )
+            if found == []:
+                return None
+            matched.extend(found)
+            return "".join(output)
+
+        CompressedStorage(path, self.ENCODING).rewrite(substitute)
+        return matched
+
+    def _substitute_cards(
+        self,
+        lines: Iterable[str],
+        replacements: Dict[Hashable, List[Tuple[int, Optional[str]]]],
+        write: Callable[[str], Any],
+        key: Optional[Callable[[str], Optional[Hashable]]] = None,
+    ) -> List[int]:
+        """Passes the cards of the lines to write, substituting the cards
+        found among the replacements, the substitutions are popped out of
+        the replacements, returns indexes of the substituted changes
+        """
+        matched: List[int] = []
+        card: List[str] = []
+        for line in lines:
+            card.append(line)
+            if not line.startswith("END:VCARD"):
+                continue
+
+            # A whole card has been read, keep it or replace it
+            vcard_str = "".join(card)
+            card = []
+            card_key = vcard_str if key is None else key(vcard_str)
+            substitutes = replacements.get(card_key)
+            if not substitutes:
+                write(vcard_str)
+                continue
+            x, substitute = substitutes.pop(0)
+            matched.append(x)
+            if substitute is not None:
+                write(substitute)
+
+        # Whatever trails the last card is preserved
+        write("".join(card))
+        return matched
+
     def export_contacts(self, export_path: str) -> None:
         """Exports the contacts to another file
 
@@ -143,4 +410,162 @@ class DAO:
 
         export_path (str): represents the target location to export data to
         """
-        shutil.copyfile(self.default_path, export_path)
+        paths = [self.default_path]
+        if self.shard_count is not None:
+            paths = self._get_shard_paths(self.default_path)
+        if paths == [self.default_path] and not is_compressed(paths[0]):
+            shutil.copyfile(self.default_path, export_path)
+            return
+
+        # Shards are concatenated, compressed files are exported as plain text
+        with open(export_path, "wb") as target:
+            for path in paths:
+                if not is_compressed(path):
+                    with open(path, "rb") as file:
+                        shutil.copyfileobj(file, target)
+                    continue
+                storage = CompressedStorage(path, self.ENCODING)
+                for text in storage.iter_blocks():
+                    target.write(text.encode(self.ENCODING))
+
+    def find_contacts(self, name: str) -> List[Person]:
+        """Returns the contacts with the specified name
+
+        In a compressed database only the blocks holding the name
+        are decompressed and parsed
+
+        name (str): the name to look for
+        """
+        if self.shard_count is None:
+            path = self.default_path
+        else:
+            path = self._get_path(Person(name))
+        if not is_compressed(path):
+            return [x for x in self.load(path) if x.name == name]
+
+        person_list = []
+        escaped_name = self.serializer.escape(name)
+        storage = CompressedStorage(path, self.ENCODING)
+        for text in storage.find_blocks(escaped_name):
+            person_list.extend(
+                x for x in self._parse_vcards(text) if x.name == name
+            )
+        return person_list
+
+    def compress(self, target_path: str, codec: str = "zlib") -> None:
+        """Copies the whole database into a new compressed database file
+
+        target_path (str): the file of the new database
+        codec (str): "zlib" or "lzma"
+        """
+        vcard_strs = (
+            self._transform_person_to_vcard_string(x) for x in self.load()
+        )
+        CompressedStorage(target_path, self.ENCODING).write(vcard_strs, codec)
+
+    def _read_manifest(self, directory: str) -> int:
+        """Returns the number of shards of a sharded database
+
+        directory (str): the directory of the sharded database
+        """
+        manifest_path = os.path.join(directory, self.MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise ValueError(
+                "{} is not a sharded database, {} is missing".format(
+                    directory, self.MANIFEST
+                )
+            )
+        with open(manifest_path, encoding=self.ENCODING) as file:
+            return json.load(file)["shards"]
+
+    def _shard_of(self, person: Person, shard_count: int) -> int:
+        """Returns the number of the shard the person belongs to
+
+        The name is hashed by crc32, which is stable across runs
+        (unlike the builtin hash of str)
+        """
+        return zlib.crc32(person.name.encode(self.ENCODING)) % shard_count
+
+    def _get_path(self, person: Person) -> str:
+        """Returns the path of the file holding the specified person"""
+        if self.shard_count is None:
+            return self.default_path
+        return os.path.join(
+            self.default_path,
+            self.SHARD_NAME.format(self._shard_of(person, self.shard_count)),
+        )
+
+    def _get_shard_paths(self, directory: str) -> List[str]:
+        """Returns paths of all the shard files of a sharded database"""
+        if directory == self.default_path and self.shard_count is not None:
+            shard_count = self.shard_count
+        else:
+            shard_count = self._read_manifest(directory)
+        return [
+            os.path.join(directory, self.SHARD_NAME.format(x))
+            for x in range(shard_count)
+        ]
+
+    def _load_shards(self, directory: str) -> List[Person]:
+        """Loads the contacts of a sharded database, shards are parsed
+        in parallel by a pool of processes
+
+        directory (str): the directory of the sharded database
+        """
+        shard_paths = self._get_shard_paths(directory)
+        if len(shard_paths) <= 1:
+            return [x for path in shard_paths for x in self.load(path)]
+
+        person_list = []
+        with ProcessPoolExecutor(
+            max_workers=min(len(shard_paths), os.cpu_count() or 1)
+        ) as executor:
+            for persons in executor.map(self.load, shard_paths):
+                person_list.extend(persons)
+        return person_list
+
+    def _write_shards(
+        self, directory: str, persons: List[Person], shard_count: int
+    ) -> None:
+        """Writes the persons into a new sharded database
+
+        directory (str): target directory, created if it doesn't exist
+        persons (List[Person]): all the contacts of the database
+        shard_count (int): number of shards to spread the contacts across
+        """
+        os.makedirs(directory, exist_ok=True)
+        shards: List[List[Person]] = [[] for _ in range(shard_count)]
+        for person in persons:
+            shards[self._shard_of(person, shard_count)].append(person)
+
+        for x, shard in enumerate(shards):
+            with open(
+                os.path.join(directory, self.SHARD_NAME.format(x)),
+                "w",
+                encoding=self.ENCODING,
+                newline=self.NEWLINE,
+            ) as file:
+                file.write(self.serializer.serialize_many(shard))
+
+        # The manifest goes last, so a half written database isn't picked up
+        with open(
+            os.path.join(directory, self.MANIFEST), "w", encoding=self.ENCODING
+        ) as file:
+            json.dump(
+                {"version": 1, "key": "name", "shards": shard_count}, file
+            )
+
+    def reshard(self, target_directory: str, shard_count: int) -> None:
+        """Copies the whole database into a new sharded database
+
+        Works for both a single file and an already sharded database,
+        this is also the way to create a new (empty) sharded database
+
+        target_directory (str): directory of the new sharded database
+        shard_count (int): number of shards of the new database
+        """
+        if os.path.isdir(target_directory) and os.listdir(target_directory):
+            raise ValueError(
+                "{} already exists and isn't empty".format(target_directory)
+            )
+        self._write_shards(target_directory, self.load(), shard_count)
@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from dao import DAO
+
+
+async def run_connection(
+    requests: List[Dict],
+    depth: int,
+    latencies: List[float],
+    host: str,
+    port: int,
+    socket_path: Optional[str],
+) -> None:
+    """Sends the requests over one connection, keeping up to depth
+    requests in flight, and records the latency of every request
+    """
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    sent_at: Dict[int, float] = {}
+    in_flight = asyncio.Semaphore(depth)
+
+    async def receive() -> None:
+        for _ in requests:
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent_at.pop(response["id"]))
+            in_flight.release()
+
+    receiver = asyncio.ensure_future(receive())
+    for request in requests:
+        await in_flight.acquire()
+        sent_at[request["id"]] = time.perf_counter()
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+    await receiver
+    writer.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Generates lookups of the contacts of the database and measures
+    the throughput and latency of the service answering them
+    """
+    contacts = DAO(args.database).load()
+    if contacts == []:
+        raise SystemExit("The database has no contacts to look up")
+
+    # Every connection gets its share of random lookups
+    requests: List[List[Dict]] = [[] for _ in range(args.connections)]
+    for x in range(args.requests):
+        person = random.choice(contacts)
+        op = random.choice(args.ops)
+        value = {
+            "name": person.name,
+            "phone": person.phone,
+            "email": person.email,
+            "birthday": person.bday[5:],
+        }[op]
+        requests[x % args.connections].append(
+            {"id": x, "op": op, "value": value}
+        )
+
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            run_connection(
+                x, args.depth, latencies, args.host, args.port, args.socket
+            )
+            for x in requests
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("requests:    {}".format(len(latencies)))
+    print("requests/s:  {:.0f}".format(len(latencies) / elapsed))
+    print(
+        "p50 latency: {:.2f} ms".format(
+            latencies[len(latencies) // 2] * 1000
+        )
+    )
+    print(
+        "p99 latency: {:.2f} ms".format(
+            latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+            * 1000
+        )
+    )
+
+
+def main() -> None:
+    """Load-tests a running contact lookup service"""
+    parser = argparse.ArgumentParser(
+        description="Measure requests per second and p99 latency"
+        " of the contact lookup service"
+    )
+    parser.add_argument(
+        "database", help="database the lookup values are sampled from"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="connect to this Unix socket")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=16,
+        help="pipelined requests in flight per connection (default: 16)",
+    )
+    parser.add_argument(
+        "--ops",
+        nargs="+",
+        choices=["name", "phone", "email", "birthday"],
+        default=["name", "phone", "email", "birthday"],
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
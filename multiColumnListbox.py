@@ -1,6 +1,9 @@
 from tkinter import BooleanVar, Scrollbar, ttk, Frame, font
-from typing import Dict, List, Optional, Tuple, Union, Any
+from typing import Dict, List, Optional, Set, Tuple, Union, Any
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from contactFilter import ContactFilter
 
 
 class MultiColumnListbox:
@@ -22,6 +25,36 @@ class MultiColumnListbox:
         # Represents the data of the selected item of self.tree
         self.selected_contact: Optional[Dict] = None
 
+        # Treeview item ids of all the rows (the filtered out ones too)
+        # mapped to their values, in the order the rows were inserted
+        self.items: Dict[str, Union[List[Any], Tuple[Any]]] = {}
+
+        # Ids of the rows detached by the filter
+        self.hidden: Set[str] = set()
+
+        # Ids of the rows in the order they are displayed in (the last
+        # applied sort), detached and deleted rows included, with the
+        # positions of the rows in it
+        self.order: List[str] = []
+        self.positions: Dict[str, int] = {}
+
+        # Number of the deleted rows still in self.order, it's compacted
+        # once they outnumber the rows
+        self._deleted: int = 0
+
+        # Live filter state: the current query, the pending debounce timer
+        # and a generation counter to drop results of outdated queries
+        self.filter: ContactFilter = ContactFilter()
+        self.query: str = ""
+        self.FILTER_DELAY: int = 150
+        self.FILTER_POLL_DELAY: int = 20
+        self.FILTER_THREAD_THRESHOLD: int = 10000
+        self._filter_timer: Optional[str] = None
+        self._filter_generation: int = 0
+        self._filter_executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1
+        )
+
         # Build the object
         self._setup()
 
@@ -31,7 +64,9 @@ class MultiColumnListbox:
         """
         # Treeview (MultiColumnListbox)
         self.tree = ttk.Treeview(
-            columns=list(self.columns.keys()), show="headings"
+            columns=list(self.columns.keys()),
+            show="headings",
+            selectmode="extended",
         )
         vertical_scrollbar = Scrollbar(
             orient="vertical", command=self.tree.yview
@@ -76,47 +111,153 @@ class MultiColumnListbox:
         focus = self.tree.focus()
         self.selected_contact = self.tree.item(focus)
 
-    def load_data(self, data: List[Union[List[Any], Tuple[Any]]]) -> None:
+    def get_selected_contacts(self) -> List[Dict]:
         """
-        Load data into the MultiColumnListbox
+        Return the data of all the selected items in the table
+        """
+        return [self.tree.item(x) for x in self.tree.selection()]
+
+    def load_data(
+        self, data: List[Union[List[Any], Tuple[Any]]]
+    ) -> List[str]:
+        """
+        Load data into the MultiColumnListbox, return the ids of the rows
         """
         # Make sure the data will be consistent and available later on
         self.data = data
 
-        # Flush whole listbox to prevent data poisoning
-        self.tree.delete(*self.tree.get_children())
+        # Flush whole listbox to prevent data poisoning, including the rows
+        # detached by the filter, and drop any outdated filtering result
+        self.tree.delete(*self.items)
+        self._filter_generation += 1
 
         # Load data
+        self.items = {}
+        self.hidden = set()
         for item in self.data:
-            self.tree.insert("", "end", values=item)
+            self.items[self.tree.insert("", "end", values=item)] = item
 
             # Adjust the width of column to fit the contents if neccessary
-            for x, content in enumerate(item):
-                column_width = font.Font().measure(content)
-                if (
-                    self.tree.column(list(self.columns.keys())[x], width=None)
-                    < column_width
-                ):
-                    self.tree.column(
-                        list(self.columns.keys())[x], width=column_width
-                    )
+            self._fit_columns(item)
+
+        self._set_order(list(self.items))
+
+        # Keep the rows narrowed down by the currently typed in query
+        self.filter = ContactFilter()
+        self.filter.set_data(self.items.keys(), self.items.values())
+        if self.query != "":
+            self._run_filter()
+        return list(self.items)
+
+    def _fit_columns(self, item: Union[List[Any], Tuple[Any]]) -> None:
+        """
+        Widen the columns which are too narrow for the contents of the row
+        """
+        for x, content in enumerate(item):
+            column_width = font.Font().measure(content)
+            if (
+                self.tree.column(list(self.columns.keys())[x], width=None)
+                < column_width
+            ):
+                self.tree.column(
+                    list(self.columns.keys())[x], width=column_width
+                )
+
+    def insert_row(self, item: Union[List[Any], Tuple[Any]]) -> str:
+        """
+        Append a single row, return its id
+        """
+        row = self.tree.insert("", "end", values=item)
+        self.items[row] = item
+        self.positions[row] = len(self.order)
+        self.order.append(row)
+        self._fit_columns(item)
+        self.filter.set_row(row, item)
+
+        # Rows not matching the currently typed in query stay hidden
+        if not self.filter.matches(row, self.query):
+            self.tree.detach(row)
+            self.hidden.add(row)
+        return row
+
+    def update_row(
+        self, row: str, item: Union[List[Any], Tuple[Any]]
+    ) -> None:
+        """
+        Replace the values of a single row
+        """
+        self.tree.item(row, values=item)
+        self.items[row] = item
+        self._fit_columns(item)
+        self.filter.set_row(row, item)
+
+        # Show or hide the row according to the currently typed in query
+        if not self.filter.matches(row, self.query):
+            if row not in self.hidden:
+                self.tree.detach(row)
+                self.hidden.add(row)
+        elif row in self.hidden:
+            self.hidden.discard(row)
+            self.tree.move(row, "", self._visible_index(row))
+
+    def _visible_index(self, row: str) -> int:
+        """
+        Return the position of a displayed row according to self.order
+        """
+        # The nearest displayed neighbour in self.order tells the position
+        order = self.order
+        position = self.positions[row]
+        for distance in range(1, max(position + 1, len(order) - position)):
+            before = position - distance
+            if before >= 0 and self._is_displayed(order[before]):
+                return self.tree.index(order[before]) + 1
+            after = position + distance
+            if after < len(order) and self._is_displayed(order[after]):
+                return self.tree.index(order[after])
+        return 0
+
+    def _is_displayed(self, row: str) -> bool:
+        return row in self.items and row not in self.hidden
+
+    def _set_order(self, order: List[str]) -> None:
+        self.order = order
+        self.positions = {row: ix for ix, row in enumerate(order)}
+        self._deleted = 0
+
+    def delete_row(self, row: str) -> None:
+        """
+        Remove a single row
+        """
+        self.tree.delete(row)
+        del self.items[row]
+        self.hidden.discard(row)
+        self.filter.remove_row(row)
+
+        # The row is left in self.order until the deleted rows pile up
+        del self.positions[row]
+        self._deleted += 1
+        if self._deleted > len(self.items):
+            self._set_order([x for x in self.order if x in self.items])
 
     def sort(self, column: str, descending: int) -> None:
         """
         Sorting of the columns by value
         """
-        # Get the data out of the column
-        data = [
-            (self.tree.set(child, column), child)
-            for child in self.tree.get_children("")
-        ]
-
-        # Sort the data
-        data.sort(reverse=descending, key=lambda x: x[0].lower())
+        # Sort all the rows, the ones hidden by the filter too, so the order
+        # is kept when the filter shows them again
+        x = list(self.columns.keys()).index(column)
+        self._set_order(
+            sorted(
+                (row for row in self.order if row in self.items),
+                reverse=descending,
+                key=lambda row: str(self.items[row][x]).lower(),
+            )
+        )
 
-        # Move the rows accordingly
-        for ix, item in enumerate(data):
-            self.tree.move(item[1], "", ix)
+        # Move the displayed rows accordingly
+        visible = (row for row in self.order if row not in self.hidden)
+        for ix, row in enumerate(visible):
+            self.tree.move(row, "", ix)
 
         # Switch the heading so it will sort in the opposite direction
         self.tree.heading(
@@ -133,3 +274,77 @@ class MultiColumnListbox:
         self.tree["displaycolumns"] = [
             x[0] for x in self.columns.items() if x[1].get()
         ]
+
+    def request_filter(self, query: str) -> None:
+        """
+        Debounced filtering of the rows, meant to be called on every keystroke
+        """
+        self.query = query
+        if self._filter_timer is not None:
+            self.tree.after_cancel(self._filter_timer)
+        self._filter_timer = self.tree.after(
+            self.FILTER_DELAY, self._run_filter
+        )
+
+    def _run_filter(self) -> None:
+        """
+        Match self.query against the rows, off the Tk thread for large data
+        """
+        self._filter_timer = None
+        self._filter_generation += 1
+        generation = self._filter_generation
+
+        # Small datasets are matched right away
+        if len(self.items) < self.FILTER_THREAD_THRESHOLD:
+            self.display_rows(self.filter.match(self.query))
+            return
+
+        # Tk isn't thread-safe, so the result is polled from the Tk thread
+        version = self.filter.version
+        future = self._filter_executor.submit(self.filter.match, self.query)
+        self._poll_filter(future, generation, version)
+
+    def _poll_filter(
+        self, future: Future, generation: int, version: int
+    ) -> None:
+        """
+        Display the result of a background filtering once it's finished
+        """
+        if generation != self._filter_generation:
+            return
+        if not future.done():
+            self.tree.after(
+                self.FILTER_POLL_DELAY,
+                lambda: self._poll_filter(future, generation, version),
+            )
+            return
+
+        # Rows were inserted, edited or deleted while the query was being
+        # matched, the result may be stale, so the query is matched again
+        if version != self.filter.version:
+            self._run_filter()
+            return
+        self.display_rows(future.result())
+
+    def display_rows(self, rows: List[str]) -> None:
+        """
+        Show only the rows with the given ids, in the order of self.order
+
+        Only the rows whose visibility changes are detached or moved
+        """
+        # Rows deleted while the query was being matched are skipped
+        shown = {row for row in rows if row in self.items}
+        visible = self.items.keys() - self.hidden
+        to_hide = visible - shown
+        to_show = shown - visible
+
+        if to_hide:
+            self.tree.detach(*to_hide)
+        if to_show:
+            ix = 0
+            for row in self.order:
+                if row in shown:
+                    if row in to_show:
+                        self.tree.move(row, "", ix)
+                    ix += 1
+        self.hidden = self.items.keys() - shown
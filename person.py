@@ -39,13 +39,16 @@ class Person:
                 return False
             if username == "":
                 return False
-            domain_name, top_lvl_domain = reminder.split(".", 1)
+            try:
+                domain_name, top_lvl_domain = reminder.split(".", 1)
+            except ValueError:
+                return False
             if domain_name == "" or top_lvl_domain == "":
                 return False
 
         # Phone validation
         if (
-            not re.compile("^+?[ 0123456789]+$").match(self.phone)
+            not re.compile("^\\+?[ 0123456789]+$").match(self.phone)
             and self.phone != ""
         ):
             return False
@@ -0,0 +1,38 @@
+import argparse
+
+from dao import DAO
+
+
+def main() -> None:
+    """Reshards a database or exports it back into a single vCard file"""
+    parser = argparse.ArgumentParser(
+        description="Reshard a contact database or export it to a vCard file"
+    )
+    parser.add_argument(
+        "source", help="single vCard file or a sharded database directory"
+    )
+    parser.add_argument(
+        "target", help="target directory, or vCard file with --export"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=16,
+        help="number of shards of the target database (default: 16)",
+    )
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="export the source into a single vCard file instead",
+    )
+    args = parser.parse_args()
+
+    dao = DAO(args.source)
+    if args.export:
+        dao.export_contacts(args.target)
+    else:
+        dao.reshard(args.target, args.shards)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+from person import Person
+
+
+class VCardSerializer:
+    def __init__(self, cache_size: int = 10000):
+        # Maximum number of serialized cards kept in the cache
+        self.cache_size: int = cache_size
+
+        # LRU cache: person data -> serialized vCard string
+        self.cache: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+
+        # vCard 3.0 limit of the line length in octets
+        self.LINE_LENGTH: int = 75
+
+    def serialize(self, person: Person) -> str:
+        """Returns the vCard string of a person, the same vObject would make
+
+        Serialized cards are cached by the person's data, so serializing
+        the same contact again (edit, delete, export) costs a dict lookup
+
+        person (Person): a Person obj to serialize
+        """
+        key = person.get_tuple_data()
+        cache = self.cache
+        try:
+            vcard_str = cache[key]
+        except KeyError:
+            vcard_str = self._serialize(key)
+            cache[key] = vcard_str
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return vcard_str
+
+    def serialize_many(self, persons: Iterable[Person]) -> str:
+        """Returns the vCard strings of all the persons joined together
+
+        persons (Iterable[Person]): Person objs to serialize
+        """
+        return "".join([self.serialize(person) for person in persons])
+
+    def _serialize(self, data: Tuple[str, ...]) -> str:
+        """Builds the vCard string out of the person's tuple data
+
+        The properties are written in the order vObject sorts them in
+        """
+        name, bday, email, phone, note = data
+        lines: List[str] = [
+            "BEGIN:VCARD\r\n",
+            "VERSION:3.0\r\n",
+            self._fold("BDAY:" + self.escape(bday)),
+            self._fold("EMAIL:" + self.escape(email)),
+            self._fold("FN:" + self.escape(name)),
+            "N:;;;;\r\n",
+            self._fold("NOTE:" + self.escape(note)),
+            self._fold("TEL:" + self.escape(phone)),
+            "END:VCARD\r\n",
+        ]
+        return "".join(lines)
+
+    def escape(self, value: str) -> str:
+        """Backslash escapes a text value as specified by vCard 3.0"""
+        value = (
+            value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        )
+        return (
+            value.replace("\r\n", "\\n")
+            .replace("\n", "\\n")
+            .replace("\r", "\\n")
+        )
+
+    def _fold(self, line: str) -> str:
+        """Folds a content line so no physical line exceeds 75 octets
+
+        Multi-byte UTF-8 characters are never split. Just like vObject,
+        lines shorter than 75 characters are left as they are.
+        """
+        line_length = self.LINE_LENGTH
+        if len(line) < line_length:
+            return line + "\r\n"
+
+        # Pure ASCII lines can be cut by characters directly
+        if line.isascii():
+            parts = [line[:line_length]]
+            for start in range(line_length, len(line), line_length - 1):
+                parts.append(line[start : start + line_length - 1])
+            return "\r\n ".join(parts) + "\r\n"
+
+        parts = []
+        start = 0
+        counter = 0
+        for x, char in enumerate(line):
+            size = len(char.encode("utf-8"))
+            if counter + size > line_length:
+                parts.append(line[start:x])
+                start = x
+                # One octet is taken by the leading space
+                counter = 1
+            counter += size
+        parts.append(line[start:])
+        return "\r\n ".join(parts) + "\r\n"
@@ -0,0 +1,142 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+import os
+
+from dao import DAO
+from person import Person
+
+
+class ImportResult:
+    def __init__(self):
+        # Contacts that were valid, not duplicate and got saved
+        self.imported: List[Person] = []
+
+        # Contacts that didn't pass the validation
+        self.invalid: List[Person] = []
+
+        # Number of contacts already present in the database or the import
+        self.duplicates: int = 0
+
+        # Files that couldn't be parsed: (path, error message)
+        self.errors: List[Tuple[str, str]] = []
+
+
+class DirectoryImporter:
+    def __init__(
+        self,
+        dao: DAO,
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        # The DAO the imported contacts are saved by
+        self.dao: DAO = dao
+
+        # Size of the pool of processes parsing the files
+        self.workers: int = workers or os.cpu_count() or 1
+
+        # Maximum number of files being parsed at once, bounds the memory
+        # taken by the contacts parsed but not yet imported
+        self.max_in_flight: int = max_in_flight or self.workers * 2
+
+        # Extension of the files to import
+        self.EXTENSION: str = ".vcf"
+
+    def list_files(self, directory: str) -> List[str]:
+        """Returns the paths of all the .vcf files in the directory tree
+
+        directory (str): the directory to import from
+        """
+        paths = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.lower().endswith(self.EXTENSION):
+                    paths.append(os.path.join(root, name))
+        paths.sort()
+        return paths
+
+    def parse_files(
+        self,
+        paths: List[str],
+        errors: List[Tuple[str, str]],
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Iterator[List[Person]]:
+        """Parses the files on the pool of processes
+
+        Yields the contacts of every successfully parsed file as soon as
+        it's parsed, the failed files are recorded in errors
+
+        paths (List[str]): the files to parse
+        errors (List[Tuple[str, str]]): collects (path, error message)
+        progress (Callable[[int, int], None], optional): called with
+        the number of the files done and the number of all the files
+        """
+        pending = {}
+        done = 0
+        files = iter(paths)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                # Keep at most max_in_flight files submitted at once
+                while len(pending) < self.max_in_flight:
+                    path = next(files, None)
+                    if path is None:
+                        break
+                    pending[executor.submit(DAO(path).load)] = path
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(paths))
+                    try:
+                        persons = future.result()
+                    except Exception as error:
+                        errors.append((path, str(error)))
+                    else:
+                        yield persons
+
+    def import_directory(
+        self,
+        directory: str,
+        existing: Iterable[Person] = (),
+        progress: Optional[Callable[[int, int], None]] = None,
+        save: bool = True,
+    ) -> ImportResult:
+        """Imports all the .vcf files of the directory into the database
+
+        The contacts of every file are validated and deduplicated as soon
+        as it's parsed, so only the imported contacts are kept in memory.
+        Valid contacts that aren't present yet are saved in name order
+        with a single buffered write
+
+        directory (str): the directory to import from
+        existing (Iterable[Person]): contacts already in the database
+        progress (Callable[[int, int], None], optional): called with
+        the number of the files done and the number of all the files
+        save (bool, optional): False leaves saving of result.imported
+        to the caller, e.g. to save them from its own thread
+        """
+        result = ImportResult()
+        seen: Set[Tuple[str, ...]] = {x.get_tuple_data() for x in existing}
+        for persons in self.parse_files(
+            self.list_files(directory), result.errors, progress
+        ):
+            for person in persons:
+                if not person.validate():
+                    result.invalid.append(person)
+                    continue
+                data = person.get_tuple_data()
+                if data in seen:
+                    result.duplicates += 1
+                    continue
+                seen.add(data)
+                result.imported.append(person)
+
+        # The files finish in any order, the order of the names is stable
+        result.imported.sort(key=lambda x: x.name)
+        result.invalid.sort(key=lambda x: x.name)
+        if save:
+            self.dao.save_many(result.imported)
+        return result